@@ -1,32 +1,48 @@
+import os
 import smtplib
+import ssl
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from datetime import datetime
 
+# Email server configuration. Implicit TLS on 465 saves the STARTTLS
+# round trip; the password is a Gmail app password read from the environment.
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 465
+SMTP_USER = "chuck.forsyth@gmail.com"  # Replace with your email
 
-def send_email(subject, body, to_email):
-    # Email server configuration
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-    smtp_user = "chuck.forsyth@gmail.com"  # Replace with your email
-    smtp_password = "Tuckerdog27"  # Replace with your email password
 
+def connect():
+    """Opens one authenticated SMTP session to be reused for every message."""
+    server = smtplib.SMTP_SSL(
+        SMTP_SERVER, SMTP_PORT, context=ssl.create_default_context()
+    )
+    server.login(SMTP_USER, os.environ["GMAIL_APP_PASSWORD"])
+    return server
+
+
+def send_email(subject, body, to_email, smtp=None):
+    """
+    Sends one message. Pass an open session from connect() to reuse it
+    across messages; otherwise a session is opened and closed for this call.
+    smtplib sessions are not thread-safe, so use one per thread.
+    """
     # Create the email
     msg = MIMEMultipart()
-    msg["From"] = smtp_user
+    msg["From"] = SMTP_USER
     msg["To"] = to_email
     msg["Subject"] = subject
 
     # Attach the email body
     msg.attach(MIMEText(body, "plain"))
 
-    # Connect to the server and send the email
     try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.sendmail(smtp_user, to_email, msg.as_string())
-        server.quit()
+        server = smtp if smtp is not None else connect()
+        try:
+            server.sendmail(SMTP_USER, to_email, msg.as_string())
+        finally:
+            if smtp is None:
+                server.quit()
         print(f"Email sent to {to_email} successfully!")
     except Exception as e:
         print(f"Failed to send email. Error: {e}")
@@ -47,4 +63,12 @@ if __name__ == "__main__":
     body = generate_report()
     to_email = "recipient@example.com"  # Replace with the recipient's email
 
-    send_email(subject, body, to_email)
+    try:
+        server = connect()
+    except Exception as e:
+        print(f"Failed to connect to {SMTP_SERVER}. Error: {e}")
+    else:
+        try:
+            send_email(subject, body, to_email, smtp=server)
+        finally:
+            server.quit()
@@ -10,92 +10,59 @@ Usage:
     python3 get_email_by_id.py <message_id>
 """
 
-import os.path
+import io
 import base64
-from email import message_from_bytes
+from email import message_from_binary_file, policy
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.auth.exceptions import RefreshError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from gmail_auth import get_service
+
 # Scopes must match those used for the token.
-SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+SCOPES = ("https://www.googleapis.com/auth/gmail.readonly",)
 TOKEN_PATH = "/home/chuck/Scripts/token_read.json"
 CREDENTIALS_PATH = "/home/chuck/Scripts/credentials.json"
+# Must be a multiple of 4 so every chunk is a complete base64 quantum.
+DECODE_CHUNK_SIZE = 4096
 
 
-def get_credentials():
+def decode_raw_message(raw):
     """
-    Gets user credentials from a local file, refreshing them if necessary.
-    Initiates the OAuth2 flow if no valid credentials are found.
+    Decodes a base64url 'raw' payload chunk by chunk into a binary buffer,
+    so the full ASCII-encoded copy of the message is never materialized.
     """
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        try:
-            creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-        except ValueError:
-            creds = None
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except RefreshError:
-                os.remove(TOKEN_PATH)
-                return get_credentials()
-        else:
-            if not os.path.exists(CREDENTIALS_PATH):
-                print(f"Error: Credentials file not found at {CREDENTIALS_PATH}")
-                return None
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)
-
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    return creds
+    buf = io.BytesIO()
+    for i in range(0, len(raw), DECODE_CHUNK_SIZE):
+        chunk = raw[i : i + DECODE_CHUNK_SIZE]
+        # The API may omit trailing padding on the final chunk.
+        buf.write(base64.urlsafe_b64decode(chunk + "=" * (-len(chunk) % 4)))
+    buf.seek(0)
+    return buf
 
 
 def get_email_body(email_message):
     """
-    Parses the email message object to extract the body.
+    Extracts the body from the email message object.
     It prioritizes HTML content, falling back to plain text.
     """
-    if email_message.is_multipart():
-        # Iterate over each part of the email
-        for part in email_message.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-
-            # Look for the main body, ignore attachments
-            if content_type == "text/html" and "attachment" not in content_disposition:
-                return part.get_payload(decode=True).decode()
-            elif (
-                content_type == "text/plain" and "attachment" not in content_disposition
-            ):
-                # Store plain text as a fallback
-                fallback_body = part.get_payload(decode=True).decode()
-    else:
-        # Not a multipart message, just get the payload
-        return email_message.get_payload(decode=True).decode()
-
-    return fallback_body  # Return plain text if no HTML found
+    # get_body() follows multipart/alternative semantics and skips
+    # attachments, so attachment subtrees are never decoded.
+    body_part = email_message.get_body(preferencelist=("html", "plain"))
+    if body_part is None:
+        return ""
+    return body_part.get_content()
 
 
 def get_email_by_id(message_id):
     """
     Retrieves and displays a single email by its ID.
     """
-    creds = get_credentials()
-    if not creds:
-        print("Could not retrieve credentials. Exiting.")
+    service = get_service(TOKEN_PATH, SCOPES, CREDENTIALS_PATH)
+    if service is None:
+        print("Exiting.")
         return
 
     try:
-        service = build("gmail", "v1", credentials=creds)
-
         # Get the full message details using the message ID
         msg = (
             service.users()
@@ -104,8 +71,9 @@ def get_email_by_id(message_id):
             .execute()
         )
 
-        msg_raw = base64.urlsafe_b64decode(msg["raw"].encode("ASCII"))
-        email_message = message_from_bytes(msg_raw)
+        email_message = message_from_binary_file(
+            decode_raw_message(msg["raw"]), policy=policy.default
+        )
 
         # Extract headers and body
         subject = email_message["subject"]
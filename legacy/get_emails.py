@@ -10,72 +10,28 @@ Usage:
     python3 get_email.py [number_of_emails]
 """
 
-import os.path
-import base64
-from email import message_from_bytes
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.auth.exceptions import RefreshError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from gmail_auth import get_service
+
 # To read emails, we need the .readonly scope.
 # If you change scopes, you must delete token.json to re-authenticate.
-SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+SCOPES = ("https://www.googleapis.com/auth/gmail.readonly",)
 TOKEN_PATH = "/home/chuck/Scripts/token_read.json"
 CREDENTIALS_PATH = "/home/chuck/Scripts/credentials.json"
-
-
-def get_credentials():
-    """
-    Gets user credentials from a local file, refreshing them if necessary.
-    Initiates the OAuth2 flow if no valid credentials are found.
-    """
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        try:
-            creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-        except ValueError:
-            # This can happen if the token file is malformed or has incorrect scopes
-            creds = None
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except RefreshError:
-                # Token is revoked or invalid, force re-authentication
-                os.remove(TOKEN_PATH)
-                return get_credentials()  # Recurse to re-auth
-        else:
-            if not os.path.exists(CREDENTIALS_PATH):
-                print(f"Error: Credentials file not found at {CREDENTIALS_PATH}")
-                print(
-                    "Please download your credentials from the Google Cloud Console and save it."
-                )
-                return None
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)
-
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    return creds
+BATCH_SIZE = 100
 
 
 def get_emails(num_emails=10):
     """
     Lists the user's latest emails in their inbox.
     """
-    creds = get_credentials()
-    if not creds:
-        print("Could not retrieve credentials. Exiting.")
+    service = get_service(TOKEN_PATH, SCOPES, CREDENTIALS_PATH)
+    if service is None:
+        print("Exiting.")
         return
 
     try:
-        service = build("gmail", "v1", credentials=creds)
-
         # Get the list of messages
         results = (
             service.users()
@@ -92,30 +48,42 @@ def get_emails(num_emails=10):
         print(f"Fetching the latest {len(messages)} emails:")
         print("-" * 30)
 
-        for msg_ref in messages:
-            # Get the full message details
-            msg = (
-                service.users()
-                .messages()
-                .get(userId="me", id=msg_ref["id"], format="raw")
-                .execute()
-            )
-
-            # The 'raw' format returns a base64url encoded string
-            msg_raw = base64.urlsafe_b64decode(msg["raw"].encode("ASCII"))
+        def print_message(request_id, msg, exception):
+            if exception is not None:
+                print(f"Message ID: {request_id}")
+                print(f"An error occurred: {exception}")
+                print("-" * 30)
+                return
 
-            # Parse the raw email into an email message object
-            email_message = message_from_bytes(msg_raw)
+            # The 'metadata' format returns only the requested headers, named
+            # as written in the message; header names are case-insensitive.
+            headers = {h["name"].lower(): h["value"] for h in msg["payload"]["headers"]}
+            subject = headers.get("subject")
+            sender = headers.get("from")
 
-            # Extract headers
-            subject = email_message["subject"]
-            sender = email_message["from"]
-
-            print(f"Message ID: {msg_ref['id']}")
+            print(f"Message ID: {request_id}")
             print(f"From: {sender}")
             print(f"Subject: {subject}")
             print("-" * 30)
 
+        # Fetch the message details in batches instead of one request per
+        # message. The Gmail API accepts up to 100 calls per batch.
+        for start in range(0, len(messages), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=print_message)
+            for msg_ref in messages[start : start + BATCH_SIZE]:
+                batch.add(
+                    service.users()
+                    .messages()
+                    .get(
+                        userId="me",
+                        id=msg_ref["id"],
+                        format="metadata",
+                        metadataHeaders=["Subject", "From"],
+                    ),
+                    request_id=msg_ref["id"],
+                )
+            batch.execute()
+
     except HttpError as error:
         print(f"An error occurred: {error}")
         # Common issue: token scope is insufficient.
@@ -0,0 +1,126 @@
+"""
+Shared Gmail API authentication for the legacy scripts.
+
+Credentials and services are cached per (token file, scopes), so a process
+that sends or fetches several messages loads the token and builds the
+client only once.
+"""
+
+import functools
+import os.path
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.model import JsonModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CREDENTIALS_PATH = "/home/chuck/Scripts/credentials.json"
+
+
+@functools.cache
+def get_credentials(token_path, scopes, credentials_path=CREDENTIALS_PATH, port=0):
+    """
+    Gets user credentials from a local file, refreshing them if necessary.
+    Initiates the OAuth2 flow if no valid credentials are found.
+    `scopes` must be a tuple so the result can be cached.
+    """
+    scopes = list(scopes)
+
+    # At most two passes: if a refresh is rejected, the token file is removed
+    # and the second pass runs the full authorization flow.
+    for _ in range(2):
+        creds = None
+        if os.path.exists(token_path):
+            try:
+                creds = Credentials.from_authorized_user_file(token_path, scopes)
+            except ValueError:
+                # This can happen if the token file is malformed or has incorrect scopes
+                creds = None
+
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                # Imported here: google.auth.transport.requests pulls in
+                # requests/urllib3, which a still-valid token never needs.
+                from google.auth.exceptions import RefreshError
+                from google.auth.transport.requests import Request
+
+                try:
+                    creds.refresh(Request())
+                except RefreshError:
+                    # Token is revoked or invalid, force re-authentication
+                    print("Credentials invalid or expired. Re-authenticating...")
+                    os.remove(token_path)
+                    continue
+            else:
+                if not os.path.exists(credentials_path):
+                    print(f"Error: Credentials file not found at {credentials_path}")
+                    print(
+                        "Please download your credentials from the Google Cloud Console and save it."
+                    )
+                    return None
+                # Only needed on first-time authorization; importing it
+                # eagerly costs hundreds of milliseconds of startup.
+                from google_auth_oauthlib.flow import InstalledAppFlow
+
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    credentials_path, scopes
+                )
+                creds = flow.run_local_server(port=port)
+
+            # Only rewrite the token file when it actually changed.
+            with open(token_path, "w") as token:
+                token.write(creds.to_json())
+
+        return creds
+    return None
+
+
+class OrjsonModel(JsonModel):
+    """
+    JsonModel that parses API responses with orjson, which is several times
+    faster than the stdlib json module on large 'raw' message strings.
+    """
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return super().deserialize(content)
+        if self._data_wrapper and isinstance(body, dict) and "data" in body:
+            body = body["data"]
+        return body
+
+
+def build_service(creds):
+    """
+    Builds a new Gmail service for the given credentials.
+
+    static_discovery uses the bundled discovery document instead of fetching
+    it over HTTPS, and the AuthorizedHttp keeps one keepalive connection for
+    every request made through the service. httplib2.Http is not thread-safe,
+    so threads should each build their own service over shared credentials.
+    """
+    authed_http = AuthorizedHttp(creds, http=httplib2.Http())
+    return build(
+        "gmail",
+        "v1",
+        http=authed_http,
+        static_discovery=True,
+        model=OrjsonModel() if orjson is not None else None,
+    )
+
+
+@functools.cache
+def get_service(token_path, scopes, credentials_path=CREDENTIALS_PATH, port=0):
+    """Returns a cached Gmail service, or None if authorization failed."""
+    creds = get_credentials(token_path, scopes, credentials_path, port)
+    if not creds:
+        print("Could not retrieve credentials.")
+        return None
+    return build_service(creds)
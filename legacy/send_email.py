@@ -1,52 +1,98 @@
 #!/usr/bin/env python3
+import html
+import io
 import os
 import sys
 import base64
 import mimetypes
 import argparse
 from typing import List, Optional, Dict, Any
-from email.message import EmailMessage
+from email import base64mime
+from email.generator import BytesGenerator
+from email.message import EmailMessage, MIMEPart
 from email import message_from_bytes
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.auth.exceptions import RefreshError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+import gmail_auth
 
 # --- Configuration ---
 # Added 'readonly' scope to fetch message details for replies/forwards
-SCOPES = [
+SCOPES = (
     "https://www.googleapis.com/auth/gmail.send",
     "https://www.googleapis.com/auth/gmail.readonly",
-]
+)
 TOKEN_PATH = "/home/chuck/Scripts/token_send.json"
 CREDENTIALS_PATH = "/home/chuck/Scripts/credentials.json"
+# Attachments above this size are base64-encoded from disk in chunks.
+STREAM_ATTACHMENT_THRESHOLD = 1024 * 1024
+# Resumable upload chunk size; must be a multiple of 256 KB.
+MEDIA_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Load the MIME type database once rather than on the first send.
+mimetypes.init()
+
+# Markdown renderer, built once at import. mistune is preferred as it is
+# several times faster than python-markdown; hard_wrap turns newlines into
+# <br> (essential for email behavior) like python-markdown's 'nl2br', and
+# the plugins cover what 'extra' provides (tables, footnotes, etc.).
+try:
+    import mistune
+
+    _render_markdown = mistune.create_markdown(
+        escape=False,
+        hard_wrap=True,
+        plugins=["strikethrough", "table", "footnotes", "def_list", "abbr"],
+    )
+except ImportError:
+    try:
+        import markdown
+
+        # Markdown instances are reusable via reset().
+        _MD = markdown.Markdown(extensions=["nl2br", "extra"])
+
+        def _render_markdown(text: str) -> str:
+            return _MD.reset().convert(text)
+
+    except ImportError:
+        _render_markdown = None
+
+# Simple quoting style
+_QUOTED_TEMPLATE = """
+        <div style=\"margin-top: 20px; padding-top: 20px; border-top: 1px solid #ddd; color: #666;\">
+            {quoted_content}
+        </div>
+        """
+
+_HTML_TEMPLATE = """
+    <html>
+      <body style="margin: 0; padding: 0; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; background-color: #f4f4f4;">
+        <div style="max-width: 600px; margin: 40px auto; background-color: #ffffff; padding: 40px; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.05); border: 1px solid #e0e0e0;">
+          <div style="color: #333333; font-size: 16px; line-height: 1.6;">
+            {formatted_text}
+          </div>
+          {quoted_html}
+        </div>
+      </body>
+    </html>
+    """
+
+# Deletion table for sanitize_header: drops CR and LF in a single C-level pass.
+_STRIP_CRLF = str.maketrans("", "", "\r\n")
 
 
 def get_credentials():
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-
-    # If creds are valid but might lack new scopes, we might get a 403 later.
-    # However, Google auth often checks scopes on load.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except (RefreshError, Exception):
-                # If refresh fails (e.g. scopes changed), remove token and re-auth
-                print("Credentials invalid or expired. Re-authenticating...")
-                if os.path.exists(TOKEN_PATH):
-                    os.remove(TOKEN_PATH)
-                return get_credentials()
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=5678)
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    return creds
+    return gmail_auth.get_credentials(TOKEN_PATH, SCOPES, CREDENTIALS_PATH, port=5678)
+
+
+def get_service(creds=None):
+    """
+    Returns the cached Gmail service, or a new one for the given credentials
+    (e.g. one per worker thread sharing a single set of credentials).
+    """
+    if creds is not None:
+        return gmail_auth.build_service(creds)
+    return gmail_auth.get_service(TOKEN_PATH, SCOPES, CREDENTIALS_PATH, port=5678)
 
 
 def create_html_content(text_content: str, quoted_content: Optional[str] = None) -> str:
@@ -66,46 +112,78 @@ def create_html_content(text_content: str, quoted_content: Optional[str] = None)
             return text_content + "<br><br>" + quoted_content
         return text_content
 
-    # Attempt to use markdown for robust formatting
-    try:
-        import markdown
-
-        # 'nl2br' turns newlines into <br> (essential for email behavior)
-        # 'extra' includes fenced_code, tables, etc.
-        formatted_text = markdown.markdown(text_content, extensions=["nl2br", "extra"])
-    except ImportError:
+    if _render_markdown is not None:
+        formatted_text = _render_markdown(text_content)
+    else:
         # Fallback if markdown isn't installed
         formatted_text = text_content.replace("\n", "<br>")
 
     quoted_html = ""
     if quoted_content:
-        # Simple quoting style
-        quoted_html = f"""
-        <div style=\"margin-top: 20px; padding-top: 20px; border-top: 1px solid #ddd; color: #666;\">
-            {quoted_content.replace(chr(10), "<br>")}
-        </div>
-        """
+        quoted_html = _QUOTED_TEMPLATE.format(
+            quoted_content=html.escape(quoted_content, quote=False).replace(
+                "\n", "<br>"
+            )
+        )
 
-    html_template = f"""
-    <html>
-      <body style="margin: 0; padding: 0; font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; background-color: #f4f4f4;">
-        <div style="max-width: 600px; margin: 40px auto; background-color: #ffffff; padding: 40px; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.05); border: 1px solid #e0e0e0;">
-          <div style="color: #333333; font-size: 16px; line-height: 1.6;">
-            {formatted_text}
-          </div>
-          {quoted_html}
-        </div>
-      </body>
-    </html>
-    """
-    return html_template
+    return _HTML_TEMPLATE.format(formatted_text=formatted_text, quoted_html=quoted_html)
 
 
 def sanitize_header(value: str) -> str:
     """Removes newlines and carriage returns from header values to prevent injection."""
     if value is None:
         return ""
-    return value.replace("\r", "").replace("\n", "").strip()
+    return value.translate(_STRIP_CRLF).strip()
+
+
+def add_file_attachment(
+    message: EmailMessage, path: str, maintype: str, subtype: str, filename: str
+) -> None:
+    """
+    Attaches a file to the message. Large files are base64-encoded straight
+    from disk in 57-byte reads (one 76-char line each, per RFC 2045), so the
+    raw file contents are never held in memory alongside their encoding.
+    """
+    if os.path.getsize(path) <= STREAM_ATTACHMENT_THRESHOLD:
+        with open(path, "rb") as fp:
+            message.add_attachment(
+                fp.read(), maintype=maintype, subtype=subtype, filename=filename
+            )
+        return
+
+    part = MIMEPart()
+    part.add_header("Content-Type", f"{maintype}/{subtype}")
+    part.add_header("Content-Disposition", "attachment", filename=filename)
+    part["Content-Transfer-Encoding"] = "base64"
+    with open(path, "rb") as fp:
+        part.set_payload(
+            "".join(
+                base64mime.body_encode(chunk)
+                for chunk in iter(lambda: fp.read(57), b"")
+            )
+        )
+
+    if message.get_content_type() != "multipart/mixed":
+        message.make_mixed()
+    message.attach(part)
+
+
+def serialize_message(message: EmailMessage) -> io.BytesIO:
+    """Serializes the message into a buffer, as message.as_bytes() would."""
+    buf = io.BytesIO()
+    BytesGenerator(buf, mangle_from_=False, policy=message.policy).flatten(message)
+    buf.seek(0)
+    return buf
+
+
+def encode_message(message: EmailMessage) -> str:
+    """
+    Base64url-encodes the message straight from a zero-copy view of its
+    serialized buffer, skipping the intermediate as_bytes() copy.
+    """
+    return base64.urlsafe_b64encode(serialize_message(message).getbuffer()).decode(
+        "ascii"
+    )
 
 
 def get_original_message(service, msg_id: str) -> Dict[str, Any]:
@@ -147,6 +225,7 @@ def send_email(
     input_file: Optional[str] = None,
     reply_to_id: Optional[str] = None,
     forward_id: Optional[str] = None,
+    service: Any = None,
 ):
     # Validation
     if input_file and not os.path.exists(input_file):
@@ -159,13 +238,14 @@ def send_email(
                 print(f"Error: Attachment file '{fpath}' not found.")
                 sys.exit(1)
 
-    creds = get_credentials()
-    if not creds:
-        print("Could not retrieve credentials.")
-        return
+    # Callers sending several messages can pass in an already-built service
+    # to skip re-loading credentials and rebuilding the client per send.
+    if service is None:
+        service = get_service()
+        if service is None:
+            return
 
     try:
-        service = build("gmail", "v1", credentials=creds)
         message = EmailMessage()
 
         # Determine body content
@@ -240,25 +320,36 @@ def send_email(
                     ctype = "application/octet-stream"
                 maintype, subtype = ctype.split("/", 1)
 
-                with open(attachment_path, "rb") as fp:
-                    file_data = fp.read()
-                    filename = os.path.basename(attachment_path)
-                    message.add_attachment(
-                        file_data,
-                        maintype=maintype,
-                        subtype=subtype,
-                        filename=sanitize_header(filename),
-                    )
-
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
+                filename = sanitize_header(os.path.basename(attachment_path))
+                add_file_attachment(
+                    message, attachment_path, maintype, subtype, filename
+                )
 
+        create_message = {}
         if thread_id:
             create_message["threadId"] = thread_id
 
-        send_message = (
-            service.users().messages().send(userId="me", body=create_message).execute()
-        )
+        if attachments:
+            # Upload messages with attachments through the resumable media
+            # endpoint: the MIME bytes are sent as-is in chunks instead of
+            # base64-wrapped in a single JSON body, which lifts the size
+            # limit from 5 MB to Gmail's 35 MB.
+            media = MediaIoBaseUpload(
+                serialize_message(message),
+                mimetype="message/rfc822",
+                chunksize=MEDIA_UPLOAD_CHUNK_SIZE,
+                resumable=True,
+            )
+            request = (
+                service.users()
+                .messages()
+                .send(userId="me", body=create_message, media_body=media)
+            )
+        else:
+            create_message["raw"] = encode_message(message)
+            request = service.users().messages().send(userId="me", body=create_message)
+
+        send_message = request.execute()
         print(f"Message Id: {send_message['id']}")
 
     except HttpError as e:
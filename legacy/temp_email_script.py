@@ -1,9 +1,88 @@
 #!/usr/bin/env python3
 import argparse
-import glob
-import subprocess
+import asyncio
+import os
+import threading
+import time
 from pathlib import Path
 
+from send_email import get_credentials, get_service, send_email
+
+DOCUMENTS_DIR = "/home/chuck/Documents"
+MY_EMAIL = "forsythc@ucr.edu"
+
+# Gmail allows 250 quota units per second per user and a send costs 100,
+# so keep a handful of sends in flight and space their starts accordingly.
+MAX_WORKERS = 5
+SEND_INTERVAL = 0.4
+
+_local = threading.local()
+_rate_lock = threading.Lock()
+_next_send_at = 0.0
+
+
+def wait_for_send_slot():
+    """Blocks until the next send fits within the per-user quota rate."""
+    global _next_send_at
+    with _rate_lock:
+        now = time.monotonic()
+        delay = _next_send_at - now
+        _next_send_at = max(now, _next_send_at) + SEND_INTERVAL
+    if delay > 0:
+        time.sleep(delay)
+
+
+def thread_service(creds):
+    """
+    Returns this worker thread's Gmail service. httplib2.Http is not
+    thread-safe, so each worker gets its own connection over shared creds.
+    """
+    if not hasattr(_local, "service"):
+        _local.service = get_service(creds)
+    return _local.service
+
+
+def process_file(file_path, creds, dry_run):
+    try:
+        # Extract recipient name from filename for the subject
+        recipient_name = Path(file_path).stem.replace("email_to_", "")
+        subject = f"Update for {recipient_name.replace('_', ' ').title()}"
+
+        if dry_run:
+            print(
+                f"DRY RUN: Would send email to '{MY_EMAIL}' with subject '{subject}' from file '{file_path}'"
+            )
+            return
+
+        service = thread_service(creds)
+        wait_for_send_slot()
+        # send_email reads the file itself and formats it with its standard
+        # template (newlines become <br>), so no copy or <pre> wrapper here.
+        print(f"Sending email to '{MY_EMAIL}' with subject '{subject}'...")
+        send_email(
+            recipients=[MY_EMAIL],
+            subject=subject,
+            input_file=file_path,
+            service=service,
+        )
+
+    except Exception as e:
+        print(f"An unexpected error occurred while processing {file_path}: {e}")
+
+
+async def send_all(files, creds, dry_run):
+    """
+    Processes every file concurrently, with at most MAX_WORKERS sends in
+    flight. Each blocking Gmail call runs in a worker thread.
+    """
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+
+    async def send_one(file_path):
+        async with semaphore:
+            await asyncio.to_thread(process_file, file_path, creds, dry_run)
+
+    await asyncio.gather(*(send_one(file_path) for file_path in files))
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -16,47 +95,26 @@ def main():
     )
     args = parser.parse_args()
 
-    my_email = "forsythc@ucr.edu"
-    files_to_process = glob.glob("/home/chuck/Documents/email_to_*.txt")
+    with os.scandir(DOCUMENTS_DIR) as it:
+        files_to_process = [
+            entry.path
+            for entry in it
+            if entry.name.startswith("email_to_") and entry.name.endswith(".txt")
+        ]
 
     if not files_to_process:
-        print("No email text files found in /home/chuck/Documents/")
+        print(f"No email text files found in {DOCUMENTS_DIR}/")
         return
 
-    for file_path in files_to_process:
-        try:
-            # Extract recipient name from filename for the subject
-            recipient_name = Path(file_path).stem.replace("email_to_", "")
-            subject = f"Update for {recipient_name.replace('_', ' ').title()}"
-
-            with open(file_path, "r") as f:
-                content = f.read()
-
-            # Wrap the content in <pre> tags for basic HTML formatting
-            html_content = f"<html><body><pre>{content}</pre></body></html>"
-
-            email_script = "/home/chuck/Scripts/send_email.py"
-            command = ["python3", email_script, my_email, subject, html_content]
-
-            if args.dry_run:
-                print(
-                    f"DRY RUN: Would send email to '{my_email}' with subject '{subject}' from file '{file_path}'"
-                )
-            else:
-                print(f"Sending email to '{my_email}' with subject '{subject}'...")
-                result = subprocess.run(
-                    command, check=True, capture_output=True, text=True
-                )
-                print("Email sent successfully.")
-                print(f"Output:\n{result.stdout}")
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error sending email for {file_path}:")
-            print(f"Return code: {e.returncode}")
-            print(f"Output:\n{e.stdout}")
-            print(f"Error Output:\n{e.stderr}")
-        except Exception as e:
-            print(f"An unexpected error occurred while processing {file_path}: {e}")
+    # Authenticate once for the whole batch; workers share the credentials.
+    creds = None
+    if not args.dry_run:
+        creds = get_credentials()
+        if not creds:
+            print("Could not retrieve credentials.")
+            return
+
+    asyncio.run(send_all(files_to_process, creds, args.dry_run))
 
 
 if __name__ == "__main__":
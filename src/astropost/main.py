@@ -1,17 +1,17 @@
 import argparse
+import functools
 from pathlib import Path
 import sys
 import os
+import time
 
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.prompt import Prompt, Confirm
-from rich.markdown import Markdown
-from dotenv import load_dotenv
-from google import genai
+from rich.text import Text
 
 from astropost.client import GmailClient
 from astropost.models import Email
@@ -27,6 +27,7 @@ ENV_PATH = CONFIG_DIR / ".env"
 DEFAULT_FROM = "Charles Forsyth <forsythc@ucr.edu>"
 
 
+@functools.lru_cache(maxsize=1)
 def get_client() -> GmailClient:
     if not CONFIG_DIR.exists():
         console.print(f"[yellow]Creating config directory at {CONFIG_DIR}[/yellow]")
@@ -35,23 +36,33 @@ def get_client() -> GmailClient:
     return GmailClient(str(TOKEN_PATH), str(CREDENTIALS_PATH))
 
 
+def _one_line(value: str) -> Text:
+    """A cell cut off with an ellipsis at its column's width, never wrapped.
+
+    no_wrap is set on the cell, not the column: rich will not narrow a no_wrap
+    column, so capped columns would push the table past narrow terminals.
+    """
+    return Text(value, no_wrap=True, overflow="ellipsis")
+
+
 def render_email_table(emails: List[Email], title: str) -> None:
     if not emails:
         console.print("[yellow]No emails found.[/yellow]")
         return
 
     table = Table(title=title)
+    # Column widths are capped by rich at render time, not by slicing values.
     table.add_column("ID", style="cyan", no_wrap=True)
-    table.add_column("Date", style="magenta")
-    table.add_column("From", style="green")
-    table.add_column("Subject", style="white")
+    table.add_column("Date", style="magenta", max_width=25, overflow="ellipsis")
+    table.add_column("From", style="green", max_width=40, overflow="ellipsis")
+    table.add_column("Subject", style="white", max_width=60, overflow="ellipsis")
 
     for email in emails:
         table.add_row(
-            str(email.id),
-            str(email.date)[:25],
-            str(email.sender)[:40],
-            str(email.subject)[:60],
+            email.id,
+            _one_line(email.date),
+            _one_line(email.sender),
+            _one_line(email.subject),
         )
     console.print(table)
 
@@ -81,6 +92,14 @@ def cmd_summarize(args: argparse.Namespace) -> None:
         console.print("Please create it with: GEMINI_API_KEY=your_key_here")
         return
 
+    # Imported here: the Gemini SDK takes about a third of a second to
+    # import, and summarize is the only command that uses it or the .env.
+    from dotenv import load_dotenv
+    from google import genai
+    from rich.live import Live
+    from rich.markdown import Markdown
+    from rich.spinner import Spinner
+
     load_dotenv(ENV_PATH)
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
@@ -97,7 +116,7 @@ def cmd_summarize(args: argparse.Namespace) -> None:
         f"[bold green]Fetching last {args.count} unread emails in Inbox..."
     ):
         emails = client.list_emails(
-            max_results=args.count, label_ids=["UNREAD", "INBOX"]
+            max_results=args.count, label_ids=["UNREAD", "INBOX"], fetch_body=True
         )
 
     if not emails:
@@ -107,23 +126,41 @@ def cmd_summarize(args: argparse.Namespace) -> None:
         f"[green]Found {len(emails)} unread emails. Generating summary...[/green]"
     )
 
-    # Construct Prompt
-    prompt_content = "Please summarize the following emails into a useful daily briefing. Group by topic if possible.\n\n"
-    for email in emails:
-        prompt_content += f"--- EMAIL ---\nFrom: {email.sender}\nSubject: {email.subject}\nDate: {email.date}\nBody:\n{email.body[:1500]}\n\n"
+    # Construct Prompt, joined once rather than grown with += per email
+    prompt_parts = [
+        "Please summarize the following emails into a useful daily briefing. Group by topic if possible.\n\n"
+    ]
+    prompt_parts.extend(
+        f"--- EMAIL ---\nFrom: {email.sender}\nSubject: {email.subject}\nDate: {email.date}\nBody:\n{email.body[:1500]}\n\n"
+        for email in emails
+    )
+    prompt_content = "".join(prompt_parts)
+
+    def summary_panel(text: str) -> Panel:
+        return Panel(Markdown(text), title="Inbox Summary", border_style="bold blue")
 
     try:
-        with console.status("[bold cyan]Querying Gemini 3.0 Pro..."):
+        # The summary is streamed into a transient panel as it is generated;
+        # the spinner only shows until the first chunk arrives. Live cannot
+        # redraw anything taller than the terminal in place, so the preview
+        # is cropped and the full panel is printed once the stream ends.
+        spinner = Spinner("dots", text="[bold cyan]Querying Gemini 3.0 Pro...")
+        chunks: List[str] = []
+        with Live(
+            spinner, console=console, refresh_per_second=10, transient=True
+        ) as live:
             # Using the requested model with the new SDK structure
             # Attempting to use the requested 3-pro-preview model.
-            response = ai_client.models.generate_content(
+            stream = ai_client.models.generate_content_stream(
                 model="gemini-2.0-flash", contents=prompt_content
             )
 
-            text = response.text or "No summary generated."
-            console.print(
-                Panel(Markdown(text), title="Inbox Summary", border_style="bold blue")
-            )
+            for chunk in stream:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    live.update(summary_panel("".join(chunks)))
+
+        console.print(summary_panel("".join(chunks) or "No summary generated."))
 
     except Exception as e:
         console.print(f"[red]Gemini API Error:[/red] {e}")
@@ -132,7 +169,7 @@ def cmd_summarize(args: argparse.Namespace) -> None:
 def cmd_show(args: argparse.Namespace) -> None:
     client = get_client()
     with console.status(f"[bold green]Fetching email {args.id}..."):
-        email = client.get_email_details(args.id)
+        email = client.get_email_full(args.id)
 
     if not email:
         console.print(f"[red]Email {args.id} not found.[/red]")
@@ -171,39 +208,53 @@ def handle_reply(client: GmailClient, email_details: Email) -> None:
                 from_address=DEFAULT_FROM,
             )
         console.print("[bold green]Reply sent![/bold green]")
-        import time
-
         time.sleep(1.5)
     except Exception as e:
         console.print(f"[red]Failed to send reply: {e}[/red]")
 
 
+def build_scan_table(emails: List[Email]) -> Table:
+    table = Table(title=f"Scan Mode: Latest {len(emails)} Emails")
+    table.add_column("#", style="bold yellow", justify="right")
+    table.add_column("From", style="green", max_width=30, overflow="ellipsis")
+    table.add_column("Subject", style="white", max_width=50, overflow="ellipsis")
+    table.add_column("Date", style="magenta", max_width=16, overflow="ellipsis")
+
+    for idx, email in enumerate(emails, 1):
+        table.add_row(
+            str(idx),
+            _one_line(email.sender),
+            _one_line(email.subject),
+            _one_line(email.date),
+        )
+    return table
+
+
 def cmd_scan(args: argparse.Namespace) -> None:
     client = get_client()
 
+    # The list is only fetched again on an explicit refresh, after a reply,
+    # or once every listed email is gone. Scan lists the inbox, so deleted
+    # and archived emails are dropped from the local list as they succeed;
+    # marking unread leaves it unchanged.
+    emails: List[Email] = []
+    # Rebuilt only when the list changes, not after every read or reply
+    table: Optional[Table] = None
+    refresh = True
     while True:
         console.clear()
-        with console.status("[bold green]Fetching latest emails..."):
-            emails = client.list_emails(max_results=args.count)
+        if refresh or not emails:
+            with console.status("[bold green]Fetching latest emails..."):
+                emails = client.list_emails(max_results=args.count)
+            table = None
+            refresh = False
 
         if not emails:
             console.print("[yellow]No emails found.[/yellow]")
             break
 
-        table = Table(title=f"Scan Mode: Latest {len(emails)} Emails")
-        table.add_column("#", style="bold yellow", justify="right")
-        table.add_column("From", style="green")
-        table.add_column("Subject", style="white")
-        table.add_column("Date", style="magenta")
-
-        for idx, email in enumerate(emails, 1):
-            table.add_row(
-                str(idx),
-                str(email.sender)[:30],
-                str(email.subject)[:50],
-                str(email.date)[:16],
-            )
-
+        if table is None:
+            table = build_scan_table(emails)
         console.print(table)
         console.print(
             "\n[dim]Commands: # (read), d # [#...] (delete), a # [#...] (archive), u # [#...] (unread), r # (reply), q (quit)[/dim]"
@@ -215,8 +266,10 @@ def cmd_scan(args: argparse.Namespace) -> None:
         if choice == "q":
             break
         elif choice == "r" and len(choice) == 1:  # refresh only if single char
+            refresh = True
             continue
         elif not choice:
+            refresh = True
             continue
 
         # Parse command
@@ -243,13 +296,9 @@ def cmd_scan(args: argparse.Namespace) -> None:
         if not valid_indices:
             if action != "unknown" and action != "read":
                 console.print("[red]No valid email numbers provided.[/red]")
-                import time
-
                 time.sleep(1)
             elif action == "read" and indices and not valid_indices:
                 console.print("[red]Invalid email number.[/red]")
-                import time
-
                 time.sleep(1)
             continue
 
@@ -261,7 +310,7 @@ def cmd_scan(args: argparse.Namespace) -> None:
 
             console.clear()
             with console.status(f"[bold green]Loading email {target_idx}..."):
-                full_email = client.get_email_details(msg_id)
+                full_email = client.get_email_full(msg_id)
 
             if full_email:
                 console.print(
@@ -285,27 +334,26 @@ def cmd_scan(args: argparse.Namespace) -> None:
                         break
                     elif sub_choice == "r":
                         handle_reply(client, full_email)
+                        refresh = True
                         break
                     elif sub_choice == "d":
                         if Confirm.ask(f"Delete email '{full_email.subject}'?"):
                             if client.trash_email(msg_id):
+                                emails.remove(selected_email)
+                                table = None
                                 console.print("[green]Deleted.[/green]")
-                                import time
-
                                 time.sleep(1)
                             break
                     elif sub_choice == "a":
                         if client.modify_labels(msg_id, remove_labels=["INBOX"]):
+                            emails.remove(selected_email)
+                            table = None
                             console.print("[green]Archived.[/green]")
-                            import time
-
                             time.sleep(1)
                         break
                     elif sub_choice == "u":
                         if client.modify_labels(msg_id, add_labels=["UNREAD"]):
                             console.print("[green]Marked as Unread.[/green]")
-                            import time
-
                             time.sleep(1)
                         break
             continue
@@ -317,22 +365,28 @@ def cmd_scan(args: argparse.Namespace) -> None:
             ):
                 continue
 
-            for target_idx in valid_indices:
-                selected_email = emails[target_idx - 1]
-                msg_id = selected_email.id
-
-                if action == "d":
-                    client.trash_email(msg_id)
-                    console.print(f"[red]Deleted #{target_idx}[/red]")
-                elif action == "a":
-                    client.modify_labels(msg_id, remove_labels=["INBOX"])
-                    console.print(f"[green]Archived #{target_idx}[/green]")
-                elif action == "u":
-                    client.modify_labels(msg_id, add_labels=["UNREAD"])
+            # One batch request or batchModify call for all selected emails
+            # rather than a round trip per email.
+            msg_ids = [emails[target_idx - 1].id for target_idx in valid_indices]
+            if action == "d":
+                trashed = set(client.trash_emails(msg_ids))
+                for target_idx, msg_id in zip(valid_indices, msg_ids):
+                    if msg_id in trashed:
+                        console.print(f"[red]Deleted #{target_idx}[/red]")
+                emails = [email for email in emails if email.id not in trashed]
+                table = None
+            elif action == "a":
+                if client.modify_labels_batch(msg_ids, remove_labels=["INBOX"]):
+                    for target_idx in valid_indices:
+                        console.print(f"[green]Archived #{target_idx}[/green]")
+                    archived = set(msg_ids)
+                    emails = [email for email in emails if email.id not in archived]
+                    table = None
+            elif action == "u":
+                client.modify_labels_batch(msg_ids, add_labels=["UNREAD"])
+                for target_idx in valid_indices:
                     console.print(f"[blue]Unread #{target_idx}[/blue]")
 
-            import time
-
             time.sleep(1.5)
 
         elif action == "r":
@@ -344,9 +398,10 @@ def cmd_scan(args: argparse.Namespace) -> None:
                 with console.status(
                     f"[bold green]Loading email {target_idx} for reply..."
                 ):
-                    full_email = client.get_email_details(msg_id)
+                    full_email = client.get_email_full(msg_id)
                 if full_email:
                     handle_reply(client, full_email)
+                    refresh = True
 
 
 def cmd_send(args: argparse.Namespace) -> None:
@@ -388,7 +443,31 @@ def cmd_send(args: argparse.Namespace) -> None:
     console.print(f"[bold green]Email sent successfully! ID: {msg_id}[/bold green]")
 
 
-def main() -> None:
+def parse_simple_command(argv: List[str]) -> Optional[argparse.Namespace]:
+    """Parses `list/ls/scan [count]` and `show ID` without building argparse.
+
+    These are the commands run most often, e.g. from shell loops. Anything
+    else, including help and malformed input, returns None for argparse.
+    """
+    if not argv or len(argv) > 2:
+        return None
+    command, rest = argv[0], argv[1:]
+    if command in SIMPLE_COUNT_COMMANDS:
+        func, count = SIMPLE_COUNT_COMMANDS[command]
+        if rest:
+            if not (rest[0].isascii() and rest[0].isdigit()):
+                return None
+            count = int(rest[0])
+        return argparse.Namespace(command=command, count=count, func=func)
+    if command == "show" and len(rest) == 1 and not rest[0].startswith("-"):
+        return argparse.Namespace(command=command, id=rest[0], func=cmd_show)
+    return None
+
+
+# Cached so the tree is built at most once per process, even when main()
+# needs it both to parse and to print help.
+@functools.lru_cache(maxsize=1)
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="AstroPost: The Modern Email Tool", prog="astropost"
     )
@@ -456,14 +535,27 @@ def main() -> None:
         "--yes", "-y", action="store_true", help="Skip confirmation (not fully impl)"
     )
     parser_send.set_defaults(func=cmd_send)
+    return parser
+
 
-    args = parser.parse_args()
+# Count-only commands: function and default count, matching build_parser()
+SIMPLE_COUNT_COMMANDS: Dict[str, Tuple[Callable[[argparse.Namespace], None], int]] = {
+    "list": (cmd_list, 5),
+    "ls": (cmd_list, 5),
+    "scan": (cmd_scan, 10),
+}
+
+
+def main() -> None:
+    args = parse_simple_command(sys.argv[1:])
+    if args is None:
+        args = build_parser().parse_args()
 
     try:
         if hasattr(args, "func"):
             args.func(args)
         else:
-            parser.print_help()
+            build_parser().print_help()
     except KeyboardInterrupt:
         console.print("\n[bold yellow]Operation cancelled by user.[/bold yellow]")
         sys.exit(0)
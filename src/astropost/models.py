@@ -1,13 +1,14 @@
-from pydantic import BaseModel, Field, ConfigDict
+from dataclasses import dataclass
 
 
-class Email(BaseModel):
+# A plain dataclass rather than a pydantic model: every field comes straight
+# from the Gmail API, and importing pydantic cost every command ~70 ms.
+@dataclass(slots=True)
+class Email:
     id: str
     threadId: str
-    sender: str = Field(alias="from")
+    sender: str
     subject: str
     date: str
     snippet: str
     body: str = ""
-
-    model_config = ConfigDict(populate_by_name=True)
@@ -36,12 +36,9 @@ def test_actions():
     found = False
     for i in range(5):
         emails = client.list_emails(max_results=20)
-        for email in emails:
-            if email["id"] == msg_id:
-                print("Found email in list.")
-                found = True
-                break
-        if found:
+        if msg_id in {email.id for email in emails}:
+            print("Found email in list.")
+            found = True
             break
         time.sleep(2)
 
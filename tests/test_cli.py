@@ -1,5 +1,20 @@
-from unittest.mock import patch
-from astropost.main import main
+import argparse
+import io
+from typing import Any, List
+from unittest.mock import MagicMock, patch
+
+from rich.console import Console
+
+from astropost.client import GmailClient
+from astropost.main import (
+    build_parser,
+    build_scan_table,
+    cmd_scan,
+    main,
+    parse_simple_command,
+    render_email_table,
+)
+from astropost.models import Email
 
 
 def test_arg_parsing_send():
@@ -23,3 +38,142 @@ def test_arg_parsing_send():
             assert call_args["recipients"] == ["test@example.com"]
             assert call_args["subject"] == "Subject"
             assert call_args["body"] == "Body"
+
+
+def test_simple_commands_match_argparse():
+    for argv in (["list"], ["ls", "7"], ["scan"], ["scan", "3"], ["show", "abc"]):
+        fast = parse_simple_command(argv)
+        assert fast is not None
+        assert vars(fast) == vars(build_parser().parse_args(argv))
+
+    for argv in ([], ["list", "x"], ["list", "-h"], ["show"], ["send", "--to", "a"]):
+        assert parse_simple_command(argv) is None
+
+
+def test_scan_applies_deletes_without_refetching() -> None:
+    emails = [
+        Email(id=i, threadId=i, sender="s", subject=i, date="d", snippet="")
+        for i in ("a", "b")
+    ]
+    client = MagicMock()
+    client.list_emails.return_value = emails
+    client.trash_emails.return_value = ["a"]
+
+    with (
+        patch("astropost.main.get_client", return_value=client),
+        patch("astropost.main.Prompt.ask", side_effect=["d 1", "d 1", "r", "q"]),
+        patch("astropost.main.Confirm.ask", return_value=True),
+        patch("astropost.main.time.sleep"),
+    ):
+        cmd_scan(argparse.Namespace(count=2))
+
+    # "d 1" deletes "a", after which "b" is #1; only "r" lists again.
+    assert [c.args[0] for c in client.trash_emails.call_args_list] == [
+        ["a"],
+        ["b"],
+    ]
+    assert client.list_emails.call_count == 2
+
+
+def test_scan_reuses_table_while_list_is_unchanged() -> None:
+    client = MagicMock()
+    client.list_emails.return_value = [
+        Email(id="a", threadId="a", sender="s", subject="a", date="d", snippet="")
+    ]
+
+    with (
+        patch("astropost.main.get_client", return_value=client),
+        patch("astropost.main.Prompt.ask", side_effect=["x", "x", "q"]),
+        patch("astropost.main.build_scan_table") as build_table,
+    ):
+        cmd_scan(argparse.Namespace(count=1))
+
+    build_table.assert_called_once()
+
+
+def test_scan_delete_with_repeated_index() -> None:
+    with (
+        patch.object(GmailClient, "_get_credentials", return_value=None),
+        patch("astropost.client.build"),
+    ):
+        client = GmailClient("token.json", "credentials.json")
+    client.list_emails = MagicMock(
+        return_value=[
+            Email(id="a", threadId="a", sender="s", subject="a", date="d", snippet="")
+        ]
+    )
+    added: List[str] = []
+
+    def new_batch(callback: Any) -> MagicMock:
+        def add(request: Any, request_id: str) -> None:
+            # Like BatchHttpRequest, which rejects a repeated request id
+            if request_id in added:
+                raise KeyError(request_id)
+            added.append(request_id)
+
+        def execute() -> None:
+            for request_id in added:
+                callback(request_id, {}, None)
+
+        batch = MagicMock()
+        batch.add.side_effect = add
+        batch.execute.side_effect = execute
+        return batch
+
+    client.service.new_batch_http_request.side_effect = new_batch
+
+    with (
+        patch("astropost.main.get_client", return_value=client),
+        patch("astropost.main.Prompt.ask", side_effect=["d 1 1", "q"]),
+        patch("astropost.main.Confirm.ask", return_value=True),
+        patch("astropost.main.time.sleep"),
+    ):
+        cmd_scan(argparse.Namespace(count=1))
+
+    assert added == ["a"]
+
+
+def test_scan_drops_archived_emails_without_refetching() -> None:
+    emails = [
+        Email(id=i, threadId=i, sender="s", subject=i, date="d", snippet="")
+        for i in ("a", "b", "c")
+    ]
+    client = MagicMock()
+    client.list_emails.return_value = emails
+    client.get_email_full.return_value = emails[0]
+
+    with (
+        patch("astropost.main.get_client", return_value=client),
+        # Archive #2 from the list, then open #1 and archive it from there
+        patch("astropost.main.Prompt.ask", side_effect=["a 2", "1", "a", "q"]),
+        patch("astropost.main.build_scan_table") as build_table,
+        patch("astropost.main.time.sleep"),
+    ):
+        cmd_scan(argparse.Namespace(count=3))
+
+    client.modify_labels_batch.assert_called_once_with(["b"], remove_labels=["INBOX"])
+    client.modify_labels.assert_called_once_with("a", remove_labels=["INBOX"])
+    client.list_emails.assert_called_once()
+    assert [e.id for e in build_table.call_args.args[0]] == ["c"]
+
+
+def test_email_tables_cut_long_values_to_one_line() -> None:
+    email = Email(
+        id="18c2f9a1b2c3d4e5",
+        threadId="t",
+        sender="A Very Long Sender Name <someone.with.a.long.address@example.com>",
+        subject="A subject line that keeps on going well past its column width",
+        date="Mon, 1 Jan 2024 10:00:00 +0000 (UTC)",
+        snippet="",
+    )
+    out = io.StringIO()
+    console = Console(file=out, width=80)
+
+    with patch("astropost.main.console", console):
+        render_email_table([email], "Emails")
+    console.print(build_scan_table([email]))
+
+    rows = [line for line in out.getvalue().splitlines() if line.startswith("│")]
+    assert len(rows) == 2
+    assert all("…" in row and len(row) <= 80 for row in rows)
+    assert "18c2f9a1b2c3d4e5" in rows[0]
@@ -0,0 +1,552 @@
+import base64
+import io
+from contextlib import ExitStack
+from email import policy
+from email.generator import BytesGenerator
+from email.message import EmailMessage
+from email.parser import BytesParser
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import MagicMock, patch
+
+import httplib2
+import markdown
+import pytest
+from googleapiclient.errors import HttpError
+from tenacity import wait_none
+
+from astropost.client import (
+    BATCH_SIZE,
+    METADATA_FIELDS,
+    METADATA_HEADERS,
+    RESUMABLE_UPLOAD_THRESHOLD,
+    GmailClient,
+    _FastBytesGenerator,
+    _guess_ctype,
+    _map_file,
+    _render_markdown,
+)
+
+
+def make_raw_message(
+    msg_id: str, subject: str = "Hello", body: str = "Body text"
+) -> Dict[str, Any]:
+    message = EmailMessage()
+    message["From"] = "Sender <sender@example.com>"
+    message["Subject"] = subject
+    message["Date"] = "Mon, 1 Jan 2024 10:00:00 +0000"
+    message.set_content(body)
+    return {
+        "id": msg_id,
+        "threadId": f"thread-{msg_id}",
+        "snippet": body[:20],
+        "raw": base64.urlsafe_b64encode(message.as_bytes()).decode(),
+    }
+
+
+def make_metadata_message(msg_id: str, subject: str = "Hello") -> Dict[str, Any]:
+    return {
+        "id": msg_id,
+        "threadId": f"thread-{msg_id}",
+        "snippet": "Body text",
+        "payload": {
+            "headers": [
+                {"name": "From", "value": "Sender <sender@example.com>"},
+                {"name": "Subject", "value": subject},
+                {"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 +0000"},
+            ]
+        },
+    }
+
+
+@pytest.fixture
+def client() -> GmailClient:
+    with (
+        patch.object(GmailClient, "_get_credentials", return_value=None),
+        patch("astropost.client.build"),
+    ):
+        return GmailClient("token.json", "credentials.json")
+
+
+def fake_batches(client: GmailClient, responses: Dict[str, Any]) -> List[MagicMock]:
+    """Makes the service's batch requests answer from `responses`.
+
+    A response that is an exception is passed to the callback as the error.
+    """
+    batches: List[MagicMock] = []
+
+    def new_batch(callback: Any) -> MagicMock:
+        batch = MagicMock()
+        added: List[str] = []
+
+        def add(request: Any, request_id: str) -> None:
+            # Like BatchHttpRequest, which rejects a repeated request id
+            if request_id in added:
+                raise KeyError(request_id)
+            added.append(request_id)
+
+        batch.add.side_effect = add
+
+        def execute() -> None:
+            for request_id in added:
+                response = responses[request_id]
+                if isinstance(response, Exception):
+                    callback(request_id, None, response)
+                else:
+                    callback(request_id, response, None)
+
+        batch.execute.side_effect = execute
+        batches.append(batch)
+        return batch
+
+    client.service.new_batch_http_request.side_effect = new_batch
+    return batches
+
+
+def test_list_emails_fetches_metadata_in_one_batch(client: GmailClient) -> None:
+    ids = ["a", "b", "c"]
+    client.service.users().messages().list().execute.return_value = {
+        "messages": [{"id": i} for i in ids]
+    }
+    batches = fake_batches(
+        client, {i: make_metadata_message(i, subject=i) for i in ids}
+    )
+
+    emails = client.list_emails(max_results=3)
+
+    assert len(batches) == 1
+    assert [e.id for e in emails] == ids
+    assert [e.subject for e in emails] == ids
+    assert emails[0].sender == "Sender <sender@example.com>"
+    assert emails[0].body == ""
+    client.service.users().messages().get.assert_called_with(
+        userId="me",
+        id="c",
+        format="metadata",
+        metadataHeaders=METADATA_HEADERS,
+        fields=METADATA_FIELDS,
+    )
+    client.service.users().messages().get().execute.assert_not_called()
+
+
+def test_metadata_header_names_are_case_insensitive(client: GmailClient) -> None:
+    msg = make_metadata_message("a", subject="Hi")
+    for header in msg["payload"]["headers"]:
+        header["name"] = header["name"].upper()
+
+    email = client._parse_message("a", msg, full=False)
+
+    assert email.sender == "Sender <sender@example.com>"
+    assert email.subject == "Hi"
+    assert email.date == "Mon, 1 Jan 2024 10:00:00 +0000"
+
+
+def test_list_emails_with_body_fetches_raw_messages(client: GmailClient) -> None:
+    client.service.users().messages().list().execute.return_value = {
+        "messages": [{"id": "a"}]
+    }
+    fake_batches(client, {"a": make_raw_message("a")})
+
+    emails = client.list_emails(max_results=1, fetch_body=True)
+
+    assert emails[0].body == "Body text"
+    client.service.users().messages().get.assert_called_with(
+        userId="me", id="a", format="raw"
+    )
+
+
+def test_list_emails_splits_batches_and_skips_failures(client: GmailClient) -> None:
+    ids = [str(i) for i in range(BATCH_SIZE + 1)]
+    client.service.users().messages().list().execute.return_value = {
+        "messages": [{"id": i} for i in ids]
+    }
+    responses: Dict[str, Any] = {i: make_metadata_message(i) for i in ids}
+    responses["5"] = RuntimeError("not found")
+    batches = fake_batches(client, responses)
+
+    emails = client.list_emails(max_results=len(ids))
+
+    assert len(batches) == 2
+    assert [e.id for e in emails] == [i for i in ids if i != "5"]
+
+
+def test_list_emails_refetches_rate_limited_batch_parts(
+    client: GmailClient,
+) -> None:
+    ids = ["a", "b", "c"]
+    client.service.users().messages().list().execute.return_value = {
+        "messages": [{"id": i} for i in ids]
+    }
+    responses: Dict[str, Any] = {i: make_metadata_message(i) for i in ids}
+    responses["b"] = HttpError(httplib2.Response({"status": 429}), b"")
+    fake_batches(client, responses)
+    client._retry = client._retry.copy(wait=wait_none())
+    client.service.users().messages().get().execute.side_effect = [
+        HttpError(httplib2.Response({"status": 429}), b""),
+        make_metadata_message("b"),
+    ]
+
+    with patch.object(client, "_fetch_email_threaded") as threaded:
+        emails = client.list_emails(max_results=3)
+
+    # Retried with backoff, not fired again on the concurrent fallback
+    threaded.assert_not_called()
+    assert [e.id for e in emails] == ids
+
+
+def test_list_emails_falls_back_when_batch_endpoint_fails(
+    client: GmailClient,
+) -> None:
+    ids = ["a", "b"]
+    client.service.users().messages().list().execute.return_value = {
+        "messages": [{"id": i} for i in ids]
+    }
+    batch = MagicMock()
+    batch.execute.side_effect = HttpError(httplib2.Response({"status": 503}), b"")
+    client.service.new_batch_http_request.return_value = batch
+
+    with patch.object(
+        client,
+        "_fetch_email_threaded",
+        side_effect=lambda i, full: client._parse_message(
+            i, make_metadata_message(i), full
+        ),
+    ) as fetch:
+        emails = client.list_emails(max_results=2)
+
+    assert sorted(call.args[0] for call in fetch.call_args_list) == ids
+    assert [e.id for e in emails] == ids
+
+
+@pytest.mark.parametrize("fast_html", [True, False])
+def test_html_body_is_converted_to_text(
+    client: GmailClient, monkeypatch: pytest.MonkeyPatch, fast_html: bool
+) -> None:
+    if fast_html:
+        pytest.importorskip("selectolax")
+    else:
+        monkeypatch.setattr("astropost.client.LexborHTMLParser", None)
+    message = EmailMessage()
+    message.set_content(
+        "<html><head><style>p {color: red}</style></head>"
+        "<body><p>Café menu</p>\n <div> </div><script>alert(1)</script></body></html>",
+        subtype="html",
+        charset="iso-8859-1",
+    )
+
+    assert client._get_email_body(message) == "Café menu"
+
+
+def test_plain_text_part_is_preferred_over_html(client: GmailClient) -> None:
+    message = EmailMessage()
+    message.set_content("Grüße", charset="iso-8859-1")
+    message.add_alternative("<html><body><p>HTML</p></body></html>", subtype="html")
+
+    with patch.object(client, "_html_to_text") as html_to_text:
+        assert client._get_email_body(message) == "Grüße"
+
+    html_to_text.assert_not_called()
+
+
+def test_full_emails_are_cached(client: GmailClient) -> None:
+    request = client.service.users().messages().get()
+    request.execute.return_value = make_raw_message("a")
+
+    first = client.get_email_full("a")
+    client.modify_labels("a", add_labels=["UNREAD"])
+    assert client.get_email_full("a") is first
+    assert client.get_email_details("a") is first
+    assert request.execute.call_count == 1
+
+
+def test_single_email_fetch_retries_server_errors(client: GmailClient) -> None:
+    client._retry = client._retry.copy(wait=wait_none())
+    request = client.service.users().messages().get()
+    request.execute.side_effect = [
+        HttpError(httplib2.Response({"status": 503}), b""),
+        make_metadata_message("a"),
+    ]
+
+    email = client.get_email_metadata("a")
+
+    assert email is not None and email.id == "a"
+    assert request.execute.call_count == 2
+
+
+def test_single_email_fetch_gives_up_after_retries(client: GmailClient) -> None:
+    client._retry = client._retry.copy(wait=wait_none())
+    request = client.service.users().messages().get()
+    request.execute.side_effect = HttpError(httplib2.Response({"status": 500}), b"")
+
+    assert client.get_email_full("a") is None
+    assert request.execute.call_count == 3
+
+
+def test_sanitize_body_extracts_code_block(client: GmailClient) -> None:
+    assert client._sanitize_body("  plain reply \n") == "plain reply"
+    assert client._sanitize_body("Here:\n```markdown\nHi there\n```\n") == "Hi there"
+
+
+def test_attachment_types_are_guessed_from_suffix() -> None:
+    assert _guess_ctype(".pdf") == ("application", "pdf")
+    assert _guess_ctype(".gz") == ("application", "octet-stream")
+    assert _guess_ctype("") == ("application", "octet-stream")
+
+
+def test_small_messages_are_sent_raw(client: GmailClient) -> None:
+    send = client.service.users().messages().send
+    send.return_value.execute.return_value = {"id": "sent"}
+
+    assert client.send_email(["to@example.com"], "Hi", "Hello") == "sent"
+
+    kwargs = send.call_args.kwargs
+    assert "media_body" not in kwargs
+    raw = base64.urlsafe_b64decode(kwargs["body"]["raw"])
+    assert b"Subject: Hi" in raw
+
+
+def test_large_messages_use_resumable_upload(
+    client: GmailClient, tmp_path: Path
+) -> None:
+    attachment = tmp_path / "big.bin"
+    attachment.write_bytes(b"\0" * RESUMABLE_UPLOAD_THRESHOLD)
+    send = client.service.users().messages().send
+    send.return_value.execute.return_value = {"id": "sent"}
+
+    client.send_email(["to@example.com"], "Hi", "Hello", attachments=[str(attachment)])
+
+    kwargs = send.call_args.kwargs
+    assert "raw" not in kwargs["body"]
+    assert kwargs["media_body"].mimetype() == "message/rfc822"
+    assert kwargs["media_body"].resumable()
+
+
+def test_clients_share_cached_credentials(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(GmailClient, "_creds_cache", {})
+    creds = MagicMock(valid=True)
+    with (
+        patch.object(GmailClient, "_get_credentials", return_value=creds) as load,
+        patch("astropost.client.build"),
+    ):
+        first = GmailClient("token.json", "credentials.json")
+        second = GmailClient("token.json", "credentials.json")
+        assert load.call_count == 1
+
+        creds.valid = False
+        GmailClient("token.json", "credentials.json")
+        assert load.call_count == 2
+
+    assert first.creds is second.creds is creds
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Hello there",
+        "First paragraph.\nStill first.\n\nSecond, with 'quotes'.",
+        "One.\n\n\nTwo.\n\nThree.",
+        "\n\nLeading and trailing blank lines.\n\n",
+        "Indented\n  line",
+        "Some **bold** text",
+        "1. one\n2. two",
+        "line with break  \nnext",
+        "tab\tseparated",
+        "a < b & c",
+        "trailing space \n",
+        "nbsp\xa0",
+        "next line\x85",
+        "line separator\u2028",
+        "vertical tab\v",
+        "form feed\f",
+    ],
+)
+def test_render_markdown_matches_markdown(text: str) -> None:
+    assert _render_markdown(text) == markdown.markdown(text)
+
+
+def test_render_markdown_skips_parser_for_plain_paragraphs() -> None:
+    with patch("astropost.client.markdown.markdown") as render:
+        html = _render_markdown("First.\nStill first.\n\nSecond.")
+    render.assert_not_called()
+    assert html == "<p>First.\nStill first.</p>\n<p>Second.</p>"
+
+
+def test_attachments_keep_their_order(client: GmailClient, tmp_path: Path) -> None:
+    names = ["b.txt", "a.pdf", "c.png"]
+    for name in names:
+        (tmp_path / name).write_bytes(name.encode())
+    paths = [str(tmp_path / name) for name in names]
+    send = client.service.users().messages().send
+    send.return_value.execute.return_value = {"id": "sent"}
+
+    client.send_email(
+        ["to@example.com"], "Hi", "Hello", attachments=[*paths, "missing.txt"]
+    )
+
+    raw = base64.urlsafe_b64decode(send.call_args.kwargs["body"]["raw"])
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    assert [a.get_filename() for a in message.iter_attachments()] == names
+
+
+def test_label_changes_are_retried(client: GmailClient) -> None:
+    client._retry = client._retry.copy(wait=wait_none())
+    modify = client.service.users().messages().modify
+    modify.return_value.execute.side_effect = [
+        HttpError(httplib2.Response({"status": 500}), b""),
+        {},
+    ]
+
+    assert client.modify_labels("a", remove_labels=["INBOX"])
+    assert modify.return_value.execute.call_count == 2
+
+
+def test_modify_labels_batch_uses_one_call_per_1000_ids(
+    client: GmailClient,
+) -> None:
+    batch_modify = client.service.users().messages().batchModify
+    ids = [str(i) for i in range(1500)]
+
+    assert client.modify_labels_batch(ids, remove_labels=["INBOX"])
+
+    bodies = [call.kwargs["body"] for call in batch_modify.call_args_list]
+    assert [body["ids"] for body in bodies] == [ids[:1000], ids[1000:]]
+    assert all(body["removeLabelIds"] == ["INBOX"] for body in bodies)
+
+
+def test_trash_emails_batches_and_skips_failures(client: GmailClient) -> None:
+    error = HttpError(httplib2.Response({"status": 404}), b"")
+    batches = fake_batches(client, {"a": {}, "b": error, "c": {}})
+
+    assert client.trash_emails(["a", "b", "c"]) == ["a", "c"]
+    assert len(batches) == 1
+
+
+def test_trash_emails_retries_rate_limited_parts(client: GmailClient) -> None:
+    client._retry = client._retry.copy(wait=wait_none())
+    error = HttpError(httplib2.Response({"status": 429}), b"")
+    fake_batches(client, {"a": {}, "b": error})
+
+    assert client.trash_emails(["a", "b", "a"]) == ["a", "b"]
+    client.service.users().messages().trash.assert_called_with(userId="me", id="b")
+
+
+def test_text_attachments_are_not_used_as_body(client: GmailClient) -> None:
+    message = EmailMessage()
+    message.set_content("<p>Real body</p>", subtype="html")
+    message.add_attachment("notes", filename="notes.txt")
+
+    assert client._get_email_body(message) == "Real body"
+
+
+def test_body_is_found_in_nested_multiparts(client: GmailClient) -> None:
+    message = EmailMessage()
+    message.set_content("Plain body")
+    message.add_alternative("<p>HTML body</p>", subtype="html")
+    message.add_attachment("notes", filename="notes.txt")
+    message.add_attachment(b"%PDF", maintype="application", subtype="pdf")
+
+    assert message.get_content_type() == "multipart/mixed"
+    assert client._get_email_body(message) == "Plain body"
+
+
+def test_empty_attachments_are_sent(client: GmailClient, tmp_path: Path) -> None:
+    empty = tmp_path / "empty.txt"
+    empty.touch()
+    send = client.service.users().messages().send
+    send.return_value.execute.return_value = {"id": "sent"}
+
+    client.send_email(["to@example.com"], "Hi", "Hello", attachments=[str(empty)])
+
+    raw = base64.urlsafe_b64decode(send.call_args.kwargs["body"]["raw"])
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    [attachment] = message.iter_attachments()
+    assert attachment.get_filename() == "empty.txt"
+    assert attachment.get_payload(decode=True) == b""
+
+
+def test_map_file_reads_files_that_report_no_size() -> None:
+    status = Path("/proc/self/status")
+    if not status.exists():
+        pytest.skip("needs procfs")
+
+    with ExitStack() as stack:
+        content = bytes(_map_file(status, stack))
+
+    assert content.startswith(b"Name:")
+
+
+def test_fast_generator_matches_bytes_generator() -> None:
+    message = EmailMessage()
+    message["Subject"] = "Grüße"
+    message.set_content("plain\nbody\r\nwith mixed endings")
+    message.add_alternative("<p>Grüße</p>", subtype="html")
+    message.add_attachment(
+        bytes(range(256)) * 64, maintype="application", subtype="octet-stream"
+    )
+
+    outputs = []
+    for generator in (BytesGenerator, _FastBytesGenerator):
+        buf = io.BytesIO()
+        generator(buf, mangle_from_=False, policy=message.policy).flatten(message)
+        outputs.append(buf.getvalue())
+
+    assert outputs[0] == outputs[1]
+
+
+def test_quoted_text_is_escaped_in_html_part(client: GmailClient) -> None:
+    request = client.service.users().messages().get()
+    request.execute.return_value = make_raw_message("a", body="<b>fish & chips</b>")
+    send = client.service.users().messages().send
+    send.return_value.execute.return_value = {"id": "sent"}
+
+    client.send_email(["to@example.com"], "", "Sounds good", reply_to_id="a")
+
+    raw = base64.urlsafe_b64decode(send.call_args.kwargs["body"]["raw"])
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    html_part = message.get_body(preferencelist=("html",))
+    assert html_part is not None
+    assert "&lt;b&gt;fish &amp; chips&lt;/b&gt;" in html_part.get_content()
+
+
+def test_save_token_replaces_file_only_when_changed(
+    client: GmailClient, tmp_path: Path
+) -> None:
+    client.token_path = tmp_path / "token.json"
+
+    client._save_token('{"token": "a"}')
+    assert client.token_path.read_text() == '{"token": "a"}'
+
+    with patch("astropost.client.os.replace") as replace:
+        client._save_token('{"token": "a"}')
+    replace.assert_not_called()
+
+    client._save_token('{"token": "b"}')
+    assert client.token_path.read_text() == '{"token": "b"}'
+    assert [p.name for p in tmp_path.iterdir()] == ["token.json"]
+
+
+def test_get_credentials_loads_a_valid_token(
+    client: GmailClient, tmp_path: Path
+) -> None:
+    client.token_path = tmp_path / "token.json"
+    client.token_path.write_text(
+        '{"token": "t", "refresh_token": "r", "client_id": "i", '
+        '"client_secret": "s", "expiry": "2099-01-01T00:00:00Z"}'
+    )
+
+    creds = client._get_credentials()
+
+    assert creds is not None
+    assert creds.token == "t"
+    assert creds.refresh_token == "r"
+
+
+def test_raw_messages_are_decoded_in_chunks(
+    client: GmailClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("astropost.client.RAW_DECODE_CHUNK", 8)
+    body = "Line of text\n" * 50
+    email = client._parse_message("a", make_raw_message("a", body=body), full=True)
+
+    assert email.subject == "Hello"
+    assert email.body == body.strip()